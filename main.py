@@ -9,42 +9,435 @@ It processes the posts directory and converts each article to a clean Markdown f
 import os
 import csv
 import re
+import argparse
+import hashlib
+import logging
+import mmap
+import pickle
+import tempfile
+from contextlib import contextmanager
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 try:
-    from bs4 import BeautifulSoup
     import html2text
+    from lxml import etree
+    from lxml import html as lxml_html
+    from tqdm import tqdm
+    from tqdm.contrib.logging import logging_redirect_tqdm
 except ImportError:
     print("Required packages not found. Please install:")
-    print("pip install beautifulsoup4 html2text")
+    print("pip install html2text lxml tqdm")
     exit(1)
 
+try:
+    import markdownify
+except ImportError:
+    markdownify = None  # Optional, only needed for --converter markdownify
+
+# Version of the generated Markdown, included in each post's content hash.
+# Bump it whenever rendering changes so re-runs convert existing posts again.
+OUTPUT_FORMAT_VERSION = 1
+
+# Available HTML to Markdown converters; 'native' falls back to html2text
+# for posts containing tags it doesn't support
+CONVERTERS = ('native', 'html2text', 'markdownify')
+
+
+class MarkdownRenderer:
+    """Render a cleaned lxml tree straight to Markdown for the common Substack tag set"""
+    
+    _WS_RE = re.compile(r'\s+')
+    _BLANKS_RE = re.compile(r'\n{3,}')
+    
+    # Finished blocks (code, lists, quotes) are replaced by placeholders while
+    # the enclosing block is normalized, so their content is never rewritten.
+    # Lists use their own marker so they can be attached to list item text.
+    _BLOCK_MARK = '\x00'
+    _LIST_MARK = '\x01'
+    _PLACEHOLDER_RE = re.compile(r'[\x00\x01](\d+)[\x00\x01]')
+    _BEFORE_LIST_RE = re.compile(r'\n+(?=\x01)')
+    
+    # Text that Markdown would read as a list marker, escaped like html2text's escape_md_section
+    _MD_DOT_RE = re.compile(r'^(\s*\d+)(\.)(?=\s)')
+    _MD_BULLET_RE = re.compile(r'^(\s*)([+*])(?=\s)')
+    _MD_DASH_RE = re.compile(r'^(\s*)(-)(?=\s|-)')
+    
+    # Tags rendered by simply emitting their children
+    _TRANSPARENT_TAGS = frozenset([
+        'html', 'body', 'div', 'span', 'section', 'article', 'header', 'footer', 'main',
+        'figure', 'figcaption', 'picture', 'source', 'sup', 'sub', 'u', 'small', 'mark',
+    ])
+    # Tags rendered as separate blocks; whitespace between them is insignificant
+    _BLOCK_TAGS = frozenset([
+        'html', 'body', 'div', 'section', 'article', 'header', 'footer', 'main', 'figure',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'ul', 'ol', 'li', 'blockquote', 'pre', 'hr',
+    ])
+    # Tags whose content is dropped
+    _SKIPPED_TAGS = frozenset(['head', 'script', 'style', 'noscript', 'button', 'svg'])
+    
+    def __init__(self):
+        self._handlers = {
+            'h1': self._heading, 'h2': self._heading, 'h3': self._heading,
+            'h4': self._heading, 'h5': self._heading, 'h6': self._heading,
+            'p': self._paragraph,
+            'a': self._link,
+            'img': self._image,
+            'ul': self._list, 'ol': self._list,
+            'blockquote': self._blockquote,
+            'strong': self._strong, 'b': self._strong,
+            'em': self._emphasis, 'i': self._emphasis,
+            's': self._strikethrough, 'del': self._strikethrough, 'strike': self._strikethrough,
+            'code': self._code,
+            'pre': self._pre,
+            'br': self._line_break,
+            'hr': self._rule,
+        }
+        self.supported_tags = frozenset(self._handlers) | self._TRANSPARENT_TAGS | self._SKIPPED_TAGS | {'li'}
+    
+    def supports(self, tree) -> bool:
+        """Check whether every element in the tree can be rendered natively"""
+        pending = [tree]
+        while pending:
+            elem = pending.pop()
+            if not isinstance(elem.tag, str):
+                continue
+            if elem.tag not in self.supported_tags:
+                return False
+            # Content of skipped tags is dropped, so it doesn't need support
+            if elem.tag not in self._SKIPPED_TAGS:
+                pending.extend(elem)
+        return True
+    
+    def render(self, tree) -> str:
+        """Render the tree to Markdown"""
+        self._blocks = []
+        try:
+            return self._block_content(tree)
+        finally:
+            self._blocks = []
+    
+    def _stash(self, text: str, mark: str) -> str:
+        """Set aside a finished block, returning its placeholder"""
+        self._blocks.append(text)
+        return f"{mark}{len(self._blocks) - 1}{mark}"
+    
+    def _unstash(self, text: str) -> str:
+        """Put set-aside blocks back in place of their placeholders"""
+        return self._PLACEHOLDER_RE.sub(lambda m: self._blocks[int(m.group(1))], text)
+    
+    def _node(self, elem) -> str:
+        if not isinstance(elem.tag, str):
+            # Comments and processing instructions
+            return ''
+        handler = self._handlers.get(elem.tag)
+        if handler is not None:
+            return handler(elem)
+        if elem.tag in self._SKIPPED_TAGS:
+            return ''
+        return self._children(elem)
+    
+    def _text(self, text: Optional[str]) -> str:
+        if not text:
+            return ''
+        text = self._WS_RE.sub(' ', text)
+        text = self._MD_DOT_RE.sub(r'\1\\\2', text)
+        text = self._MD_BULLET_RE.sub(r'\1\\\2', text)
+        return self._MD_DASH_RE.sub(r'\1\\\2', text)
+    
+    def _preformatted(self, elem) -> str:
+        """Return the raw text of an element, keeping <br> as newlines"""
+        out = StringIO()
+        out.write(elem.text or '')
+        for child in elem:
+            if child.tag == 'br':
+                out.write('\n')
+            elif isinstance(child.tag, str):
+                out.write(self._preformatted(child))
+            out.write(child.tail or '')
+        return out.getvalue()
+    
+    def _is_block(self, elem) -> bool:
+        return elem is not None and elem.tag in self._BLOCK_TAGS
+    
+    def _children(self, elem) -> str:
+        out = StringIO()
+        children = list(elem)
+        text = self._text(elem.text)
+        if not (text == ' ' and children and self._is_block(children[0])):
+            out.write(text)
+        for i, child in enumerate(children):
+            out.write(self._node(child))
+            tail = self._text(child.tail)
+            following = children[i + 1] if i + 1 < len(children) else None
+            if tail == ' ' and (self._is_block(child) or self._is_block(following)):
+                continue
+            # Don't start a new line with the whitespace following a break
+            out.write(tail.lstrip(' ') if child.tag == 'br' else tail)
+        return out.getvalue()
+    
+    def _block_content(self, elem, tight_lists: bool = False) -> str:
+        """Render children of a block, collapsing runs of blank lines between blocks"""
+        content = self._BLANKS_RE.sub('\n\n', self._children(elem))
+        if tight_lists:
+            # Attach nested lists to the preceding text without a blank line
+            content = self._BEFORE_LIST_RE.sub('\n', content)
+        return self._unstash(content.strip())
+    
+    def _heading(self, elem) -> str:
+        level = int(elem.tag[1])
+        return f"\n\n{'#' * level} {self._children(elem).strip()}\n\n"
+    
+    def _paragraph(self, elem) -> str:
+        return f"\n\n{self._children(elem).strip()}\n\n"
+    
+    def _link(self, elem) -> str:
+        text = self._children(elem).strip()
+        href = elem.get('href', '')
+        # Skip internal links, as html2text is configured to do
+        if not href or href.startswith('#'):
+            return text
+        return f"[{text}]({href})"
+    
+    def _image(self, elem) -> str:
+        return f"![{elem.get('alt', '')}]({elem.get('src', '')})"
+    
+    def _list(self, elem) -> str:
+        out = StringIO()
+        try:
+            number = int(elem.get('start', 1))
+        except ValueError:
+            number = 1
+        for item in elem:
+            if item.tag != 'li':
+                continue
+            if elem.tag == 'ol':
+                marker = f"{number}. "
+                number += 1
+            else:
+                marker = "- "
+            lines = self._block_content(item, tight_lists=True).split('\n')
+            indent = ' ' * len(marker)
+            out.write(marker + lines[0])
+            for line in lines[1:]:
+                out.write('\n' + (indent + line if line else line))
+            out.write('\n')
+        return f"\n\n{self._stash(out.getvalue().rstrip(), self._LIST_MARK)}\n\n"
+    
+    def _blockquote(self, elem) -> str:
+        lines = self._block_content(elem).split('\n')
+        quoted = '\n'.join(f"> {line}" if line else ">" for line in lines)
+        return f"\n\n{self._stash(quoted, self._BLOCK_MARK)}\n\n"
+    
+    def _wrap(self, elem, marker: str) -> str:
+        text = self._children(elem)
+        stripped = text.strip()
+        if not stripped:
+            return text
+        # Keep surrounding whitespace outside the markers
+        leading = text[:len(text) - len(text.lstrip())]
+        trailing = text[len(text.rstrip()):]
+        return f"{leading}{marker}{stripped}{marker}{trailing}"
+    
+    def _strong(self, elem) -> str:
+        return self._wrap(elem, '**')
+    
+    def _emphasis(self, elem) -> str:
+        return self._wrap(elem, '_')
+    
+    def _strikethrough(self, elem) -> str:
+        return self._wrap(elem, '~~')
+    
+    def _code(self, elem) -> str:
+        return f"`{self._preformatted(elem)}`"
+    
+    def _pre(self, elem) -> str:
+        code = self._preformatted(elem).strip('\n')
+        fenced = f"```\n{code}\n```"
+        return f"\n\n{self._stash(fenced, self._BLOCK_MARK)}\n\n"
+    
+    def _line_break(self, elem) -> str:
+        return "  \n"
+    
+    def _rule(self, elem) -> str:
+        return "\n\n* * *\n\n"
+
+
+class PostMetadata(NamedTuple):
+    """Metadata for a single post, as listed in posts.csv"""
+    title: str
+    subtitle: str
+    date: str
+    type: str
+    published: bool
+
+
+class _TitleCharTable(dict):
+    """str.translate table keeping word characters, whitespace and dashes.
+    
+    Entries are filled in on first lookup, so the table only ever holds the
+    characters that actually appear in titles.
+    """
+    
+    def __missing__(self, codepoint: int) -> Optional[int]:
+        char = chr(codepoint)
+        # Same classes as the regex [\w\s-]
+        keep = char.isalnum() or char.isspace() or char in '_-'
+        value = codepoint if keep else None
+        self[codepoint] = value
+        return value
+
+
+def _class_xpath(classes) -> etree.XPath:
+    """Compile an XPath matching divs that have any of the given classes"""
+    conditions = ' or '.join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')" for name in sorted(classes)
+    )
+    return etree.XPath(f"//div[{conditions}]")
+
+
+# Frontmatter values for posts missing from posts.csv
+_UNKNOWN_POST = PostMetadata(title='Untitled', subtitle='', date='', type='post', published=False)
+
+# Encoded frontmatter fragments, shared by every post
+_FM_OPEN = b'---\n'
+_FM_TITLE = b'title: "'
+_FM_SUBTITLE = b'subtitle: "'
+_FM_QUOTE_END = b'"\n'
+_FM_DATE = b'date: '
+_FM_TYPE = b'type: '
+_FM_PUBLISHED = {True: b'published: true\n', False: b'published: false\n'}
+_FM_ID = b'substack_id: '
+_FM_HASH = b'content_hash: '
+_FM_CLOSE = b'---\n\n'
+_NEWLINE = b'\n'
+
+# posts.csv columns read into PostMetadata, in field order
+_METADATA_COLUMNS = ('title', 'subtitle', 'post_date', 'type', 'is_published')
+
+
+# html2text converter shared by all conversions in this process (see _get_h2t)
+_H2T = None
+
+
+def _get_h2t() -> html2text.HTML2Text:
+    """Return the process-wide html2text converter, configuring it on first use"""
+    global _H2T
+    if _H2T is None:
+        _H2T = html2text.HTML2Text()
+        _H2T.ignore_links = False
+        _H2T.ignore_images = False
+        _H2T.ignore_emphasis = False
+        _H2T.ignore_tables = False
+        _H2T.body_width = 0  # No line wrapping
+        _H2T.unicode_snob = True
+        _H2T.skip_internal_links = True
+    return _H2T
+
+
+# Converter instance used by pool worker processes (set by _init_worker)
+_worker_converter = None
+
+
+def _init_worker(converter: "SubstackConverter", metadata_path: str) -> None:
+    """Install the converter for the current worker process"""
+    global _worker_converter
+    # Load posts metadata from the snapshot written by convert_all
+    with open(metadata_path, 'rb') as f:
+        snapshot = pickle.load(f)
+    converter.posts_metadata = {post_id: PostMetadata._make(row) for post_id, row in snapshot}
+    _worker_converter = converter
+
+
+def _convert_one(html_file: Path) -> Tuple[bool, Optional[str]]:
+    """Convert a single HTML file inside a worker process.
+    
+    Errors are returned rather than logged, so the main process can report
+    them without breaking up its progress bar.
+    """
+    try:
+        return _worker_converter._convert_file(html_file), None
+    except Exception as e:
+        return False, str(e)
+
 
 class SubstackConverter:
-    def __init__(self, export_dir: str, output_dir: str = "markdown_posts"):
+    # Precompiled patterns used for every converted file
+    _BLANK3_RE = re.compile(r'\n\s*\n\s*\n')
+    _TITLE_CHARS = _TitleCharTable()
+    _TITLE_DASH_RE = re.compile(r'[-\s]+')
+    
+    # Substack-specific containers that are removed entirely
+    _REMOVE_CLASSES = frozenset([
+        'subscription-widget',
+        'subscription-widget-wrap-editor',
+        'poll-embed',
+        'captioned-button-wrap',
+    ])
+    _IMAGE_CONTAINER_CLASS = 'captioned-image-container'
+    _REMOVE_XPATH = _class_xpath(_REMOVE_CLASSES)
+    _IMAGE_CONTAINER_XPATH = _class_xpath([_IMAGE_CONTAINER_CLASS])
+    
+    # Inline tags sharing a Markdown marker; adjacent ones are merged so the
+    # markers don't run together (e.g. "_a__b_")
+    _INLINE_GROUPS = {
+        'strong': 'strong', 'b': 'strong',
+        'em': 'em', 'i': 'em',
+        's': 's', 'del': 's', 'strike': 's',
+        'code': 'code',
+    }
+    # Raw markers showing that a post contains any of the classes above
+    _CLEANUP_MARKERS = tuple(c.encode() for c in sorted(_REMOVE_CLASSES | {_IMAGE_CONTAINER_CLASS}))
+    
+    # Posts are parsed from raw bytes, which Substack exports as UTF-8
+    _HTML_PARSER = lxml_html.HTMLParser(encoding='utf-8')
+    
+    # Posts at least this large are memory-mapped and fed to the parser in slices
+    _MMAP_THRESHOLD = 64 * 1024
+    _PARSE_CHUNK_SIZE = 1024 * 1024
+    
+    def __init__(self, export_dir: str, output_dir: str = "markdown_posts", jobs: Optional[int] = None,
+                 converter: str = 'native', force: bool = False):
+        if converter not in CONVERTERS:
+            raise ValueError(f"Unknown converter {converter!r}, expected one of: {', '.join(CONVERTERS)}")
+        if converter == 'markdownify' and markdownify is None:
+            raise ImportError("The markdownify converter requires: pip install markdownify")
+        
         self.export_dir = Path(export_dir)
         self.output_dir = Path(output_dir)
+        if jobs is not None and jobs < 1:
+            raise ValueError(f"jobs must be at least 1, got {jobs}")
+        self.jobs = jobs or os.cpu_count() or 1
+        self.converter = converter
+        self.force = force
         self.posts_dir = self.export_dir / "posts"
         self.posts_csv = self.export_dir / "posts.csv"
         
         # Create output directory
         self.output_dir.mkdir(exist_ok=True)
         
-        # HTML to Markdown converter configuration
-        self.h2t = html2text.HTML2Text()
-        self.h2t.ignore_links = False
-        self.h2t.ignore_images = False
-        self.h2t.ignore_emphasis = False
-        self.h2t.body_width = 0  # No line wrapping
-        self.h2t.unicode_snob = True
-        self.h2t.skip_internal_links = True
+        # HTML to Markdown converter; html2text (see _get_h2t) handles
+        # documents with tags the native renderer doesn't support
+        self.renderer = MarkdownRenderer()
         
         # Load posts metadata
         self.posts_metadata = self._load_posts_metadata()
     
-    def _load_posts_metadata(self) -> Dict[str, Dict]:
+    def __getstate__(self) -> Dict:
+        """Drop per-process state when shipping the converter to workers"""
+        state = self.__dict__.copy()
+        # Workers load metadata from a snapshot file instead (see _init_worker)
+        del state['posts_metadata']
+        return state
+    
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.posts_metadata = {}
+    
+    def _load_posts_metadata(self) -> Dict[str, PostMetadata]:
         """Load posts metadata from posts.csv"""
         metadata = {}
         
@@ -54,16 +447,21 @@ class SubstackConverter:
         
         try:
             with open(self.posts_csv, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
+                reader = csv.reader(f)
+                header = next(reader)
+                id_idx = header.index('post_id')
+                title_idx, subtitle_idx, date_idx, type_idx, published_idx = (
+                    header.index(column) for column in _METADATA_COLUMNS
+                )
                 for row in reader:
-                    post_id = row['post_id'].split('.')[0]  # Extract just the numeric ID
-                    metadata[post_id] = {
-                        'title': row['title'],
-                        'subtitle': row['subtitle'],
-                        'date': row['post_date'],
-                        'type': row['type'],
-                        'published': row['is_published'] == 'true'
-                    }
+                    post_id = row[id_idx].split('.', 1)[0]  # Extract just the numeric ID
+                    metadata[post_id] = PostMetadata(
+                        row[title_idx],
+                        row[subtitle_idx],
+                        row[date_idx],
+                        row[type_idx],
+                        row[published_idx] == 'true',
+                    )
         except Exception as e:
             print(f"Error reading posts.csv: {e}")
         
@@ -73,123 +471,275 @@ class SubstackConverter:
         """Extract post ID from filename"""
         return filename.split('.')[0]
     
-    def _clean_html_content(self, html_content: str) -> str:
-        """Clean and prepare HTML content for conversion"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Remove subscription widgets and other Substack-specific elements
-        for elem in soup.find_all(['div'], class_=['subscription-widget', 'subscription-widget-wrap-editor']):
-            elem.decompose()
-        
-        # Remove poll embeds
-        for elem in soup.find_all(['div'], class_=['poll-embed']):
-            elem.decompose()
-        
-        # Remove share buttons
-        for elem in soup.find_all(['div'], class_=['captioned-button-wrap']):
-            elem.decompose()
-        
-        # Clean up image containers - keep images but simplify structure
-        for img_container in soup.find_all(['div'], class_=['captioned-image-container']):
-            # Find the actual image
-            img = img_container.find('img')
-            if img:
-                # Get the caption if it exists
-                caption = img_container.find('figcaption')
-                caption_text = caption.get_text().strip() if caption else ""
-                
-                # Create a simplified structure
-                new_content = f'<img src="{img.get("src", "")}" alt="{img.get("alt", "")}">'
-                if caption_text:
-                    new_content += f'<br><em>{caption_text}</em>'
-                
-                img_container.replace_with(BeautifulSoup(new_content, 'html.parser'))
-        
-        # Remove excessive whitespace and clean up
-        cleaned = str(soup)
-        cleaned = re.sub(r'\s+', ' ', cleaned)
-        cleaned = re.sub(r'<br\s*/?>\s*<br\s*/?>', '\n\n', cleaned)
-        
-        return cleaned
+    @contextmanager
+    def _open_html(self, html_file: Path):
+        """Yield the raw HTML of a post, memory-mapping large files"""
+        if os.path.getsize(html_file) < self._MMAP_THRESHOLD:
+            yield html_file.read_bytes()
+            return
+        
+        with open(html_file, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield mm
+    
+    def _parse_html(self, html_content):
+        """Parse HTML bytes or a memory-mapped file, returning None for empty posts"""
+        if isinstance(html_content, mmap.mmap):
+            # Feed the mapping in slices so the file is never copied whole
+            parser = lxml_html.HTMLParser(encoding='utf-8')
+            for start in range(0, len(html_content), self._PARSE_CHUNK_SIZE):
+                parser.feed(html_content[start:start + self._PARSE_CHUNK_SIZE])
+            return parser.close()
+        
+        if not html_content.strip():
+            return None
+        return lxml_html.document_fromstring(html_content, parser=self._HTML_PARSER)
+    
+    def _clean_html_content(self, html_content):
+        """Clean and prepare HTML content for conversion, returning the parsed tree"""
+        tree = self._parse_html(html_content)
+        if tree is None:
+            return None
+        
+        # Drop Substack-specific elements (subscription widgets, polls, share buttons)
+        # and simplify image containers. A substring check on the raw HTML skips
+        # the tree queries for posts without any.
+        if any(html_content.find(marker) != -1 for marker in self._CLEANUP_MARKERS):
+            for elem in self._REMOVE_XPATH(tree):
+                elem.drop_tree()
+            for elem in self._IMAGE_CONTAINER_XPATH(tree):
+                self._simplify_image_container(elem)
+        
+        # Turn double line breaks inside a paragraph into a paragraph break by
+        # splitting it in two; breaks elsewhere are left as they are
+        for br in list(tree.iter('br')):
+            prev = br.getprevious()
+            parent = br.getparent()
+            if (prev is not None and prev.tag == 'br' and not (prev.tail or '').strip()
+                    and parent.tag == 'p'):
+                following = lxml_html.Element('p')
+                following.text = br.tail
+                for sibling in list(br.itersiblings()):
+                    following.append(sibling)
+                following.tail = parent.tail
+                parent.tail = None
+                parent.addnext(following)
+                parent.remove(prev)
+                parent.remove(br)
+        
+        self._merge_adjacent_inline(tree)
+        
+        return tree
+    
+    def _merge_adjacent_inline(self, tree) -> None:
+        """Merge directly adjacent inline elements that share a Markdown marker"""
+        for elem in list(tree.iter(*self._INLINE_GROUPS)):
+            # Skip elements already merged into a preceding one
+            if elem.getparent() is None:
+                continue
+            group = self._INLINE_GROUPS[elem.tag]
+            following = elem.getnext()
+            while (following is not None and not elem.tail
+                   and self._INLINE_GROUPS.get(following.tag) == group):
+                # Move the following element's content to the end of this one
+                if following.text:
+                    if len(elem):
+                        elem[-1].tail = (elem[-1].tail or '') + following.text
+                    else:
+                        elem.text = (elem.text or '') + following.text
+                for child in list(following):
+                    elem.append(child)
+                elem.tail = following.tail
+                following.tail = None
+                elem.getparent().remove(following)
+                following = elem.getnext()
+    
+    def _html_to_markdown(self, tree) -> str:
+        """Convert a cleaned tree to Markdown"""
+        if tree is None:
+            return ""
+        
+        if self.converter == 'native' and self.renderer.supports(tree):
+            return self.renderer.render(tree)
+        
+        cleaned = lxml_html.tostring(tree, encoding='unicode')
+        if self.converter == 'markdownify':
+            markdown_content = markdownify.markdownify(cleaned, heading_style='ATX', bullets='-')
+        else:
+            markdown_content = _get_h2t().handle(cleaned)
+        
+        # Clean up markdown
+        return self._BLANK3_RE.sub('\n\n', markdown_content)
+    
+    def _simplify_image_container(self, container) -> None:
+        """Replace an image container with the image and its caption"""
+        # Find the actual image
+        img = container.find('.//img')
+        if img is None:
+            return
+        
+        # Get the caption if it exists
+        caption = container.find('.//figcaption')
+        caption_text = caption.text_content().strip() if caption is not None else ""
+        
+        # Create a simplified structure
+        new_nodes = [lxml_html.Element('img', src=img.get('src', ''), alt=img.get('alt', ''))]
+        if caption_text:
+            em = lxml_html.Element('em')
+            em.text = caption_text
+            new_nodes += [lxml_html.Element('br'), em]
+        
+        new_nodes[-1].tail = container.tail
+        for node in new_nodes:
+            container.addprevious(node)
+        container.getparent().remove(container)
     
     def _format_date(self, date_str: str) -> str:
         """Format date string for frontmatter"""
+        # Substack exports ISO 8601 dates, whose first 10 characters are the date
+        if len(date_str) >= 10 and date_str[4] == '-' and date_str[7] == '-':
+            return date_str[:10]
+        
         try:
             dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
             return dt.strftime('%Y-%m-%d')
         except:
             return date_str
     
-    def _create_frontmatter(self, post_id: str, metadata: Dict) -> str:
-        """Create frontmatter for the markdown file"""
-        frontmatter = "---\n"
-        frontmatter += f"title: \"{metadata.get('title', 'Untitled')}\"\n"
+    def _create_frontmatter(self, post_id: str, metadata: Optional[PostMetadata], content_hash: str) -> bytes:
+        """Create UTF-8 encoded frontmatter for the markdown file"""
+        if metadata is None:
+            metadata = _UNKNOWN_POST
         
-        subtitle = metadata.get('subtitle', '').strip()
+        parts = [_FM_OPEN, _FM_TITLE, metadata.title.encode('utf-8'), _FM_QUOTE_END]
+        
+        subtitle = metadata.subtitle.strip()
         if subtitle:
-            frontmatter += f"subtitle: \"{subtitle}\"\n"
+            parts += [_FM_SUBTITLE, subtitle.encode('utf-8'), _FM_QUOTE_END]
         
-        frontmatter += f"date: {self._format_date(metadata.get('date', ''))}\n"
-        frontmatter += f"type: {metadata.get('type', 'post')}\n"
-        frontmatter += f"published: {str(metadata.get('published', False)).lower()}\n"
-        frontmatter += f"substack_id: {post_id}\n"
-        frontmatter += "---\n\n"
+        parts += [
+            _FM_DATE, self._format_date(metadata.date).encode('utf-8'), _NEWLINE,
+            _FM_TYPE, metadata.type.encode('utf-8'), _NEWLINE,
+            _FM_PUBLISHED[metadata.published],
+            _FM_ID, post_id.encode('utf-8'), _NEWLINE,
+            _FM_HASH, content_hash.encode('ascii'), _NEWLINE,
+            _FM_CLOSE,
+        ]
+        return b''.join(parts)
+    
+    def _write_output(self, output_path: Path, chunks: List[bytes]) -> None:
+        """Write chunks to a file in order with a gather write where available.
         
-        return frontmatter
+        The chunks go to a temporary file that replaces the output once
+        complete, so a failed write never leaves a truncated output behind.
+        """
+        temp_path = output_path.with_name(f".{os.urandom(8).hex()}.tmp")
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+        fd = os.open(temp_path, flags, 0o644)
+        try:
+            views = [memoryview(chunk) for chunk in chunks if chunk]
+            while views:
+                if hasattr(os, 'writev'):
+                    written = os.writev(fd, views)
+                else:
+                    written = os.write(fd, views[0])
+                # Drop what was written, keeping the rest of a partially written chunk
+                while views and written >= len(views[0]):
+                    written -= len(views[0])
+                    views.pop(0)
+                if views:
+                    views[0] = views[0][written:]
+        except BaseException:
+            os.close(fd)
+            os.unlink(temp_path)
+            raise
+        os.close(fd)
+        os.replace(temp_path, output_path)
+    
+    def _content_hash(self, html_content, post_id: str, metadata: Optional[PostMetadata]) -> str:
+        """Hash everything a post's output depends on: HTML, metadata, converter and output format"""
+        digest = hashlib.sha256(html_content)
+        digest.update(repr((post_id, metadata, self.converter, OUTPUT_FORMAT_VERSION)).encode('utf-8'))
+        return digest.hexdigest()
+    
+    def _read_hash(self, output_path: Path) -> Optional[str]:
+        """Read the content hash from an existing output's frontmatter, if any"""
+        try:
+            with open(output_path, 'rb') as f:
+                if f.readline() != _FM_OPEN:
+                    return None
+                for line in f:
+                    if line == _FM_OPEN:
+                        break
+                    if line.startswith(_FM_HASH):
+                        return line[len(_FM_HASH):].strip().decode('ascii')
+        except (OSError, UnicodeDecodeError):
+            pass
+        return None
+    
+    def _is_unpublished(self, metadata: Optional[PostMetadata]) -> bool:
+        """Check whether a post is a draft; posts missing from posts.csv are kept"""
+        return metadata is not None and not metadata.published
     
     def convert_file(self, html_file: Path) -> bool:
-        """Convert a single HTML file to Markdown"""
+        """Convert a single HTML file to Markdown, logging any error"""
         try:
-            # Read HTML content
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # Extract post ID
-            post_id = self._extract_post_id(html_file.name)
-            
-            # Get metadata
-            metadata = self.posts_metadata.get(post_id, {})
-            
-            # Skip unpublished posts
-            if not metadata.get('published', True):
-                print(f"Skipping unpublished post: {html_file.name}")
-                return False
-            
-            # Clean HTML content
-            cleaned_html = self._clean_html_content(html_content)
-            
-            # Convert to Markdown
-            markdown_content = self.h2t.handle(cleaned_html)
-            
-            # Clean up markdown
-            markdown_content = re.sub(r'\n\s*\n\s*\n', '\n\n', markdown_content)
-            markdown_content = markdown_content.strip()
-            
-            # Create frontmatter
-            frontmatter = self._create_frontmatter(post_id, metadata)
-            
-            # Combine frontmatter and content
-            full_content = frontmatter + markdown_content
-            
-            # Generate output filename
-            title = metadata.get('title', html_file.stem)
-            # Clean title for filename
-            safe_title = re.sub(r'[^\w\s-]', '', title).strip()
-            safe_title = re.sub(r'[-\s]+', '-', safe_title)
-            
-            output_filename = f"{post_id}_{safe_title}.md"
-            output_path = self.output_dir / output_filename
-            
-            # Write Markdown file
-            with open(output_path, 'w', encoding='utf-8') as f:
-                f.write(full_content)
-            
-            print(f"Converted: {html_file.name} -> {output_filename}")
-            return True
-            
+            return self._convert_file(html_file)
         except Exception as e:
-            print(f"Error converting {html_file.name}: {e}")
+            logging.warning("Error converting %s: %s", html_file.name, e)
+            return False
+    
+    def _convert_file(self, html_file: Path) -> bool:
+        """Convert a single HTML file to Markdown, raising on errors"""
+        # Extract post ID
+        post_id = self._extract_post_id(html_file.name)
+        
+        # Get metadata
+        metadata = self.posts_metadata.get(post_id)
+        
+        # Skip unpublished posts before reading them
+        if self._is_unpublished(metadata):
+            print(f"Skipping unpublished post: {html_file.name}")
             return False
+        
+        # Generate output filename
+        title = metadata.title if metadata is not None else html_file.stem
+        # Clean title for filename
+        safe_title = title.translate(self._TITLE_CHARS).strip()
+        safe_title = self._TITLE_DASH_RE.sub('-', safe_title)
+        
+        output_filename = f"{post_id}_{safe_title}.md"
+        output_path = self.output_dir / output_filename
+        
+        # Read and clean HTML content; the parser decodes the bytes itself
+        with self._open_html(html_file) as html_content:
+            # Skip posts whose input is unchanged since the last run
+            content_hash = self._content_hash(html_content, post_id, metadata)
+            if not self.force and self._read_hash(output_path) == content_hash:
+                return True
+            
+            tree = self._clean_html_content(html_content)
+        
+        # Convert to Markdown
+        markdown_content = self._html_to_markdown(tree)
+        
+        markdown_content = markdown_content.strip()
+        
+        # Create frontmatter
+        frontmatter = self._create_frontmatter(post_id, metadata, content_hash)
+        
+        # Write frontmatter and content without joining them first
+        self._write_output(output_path, [frontmatter, markdown_content.encode('utf-8')])
+        
+        return True
+    
+    def _write_metadata_snapshot(self) -> str:
+        """Pickle posts metadata to a temporary file for worker processes"""
+        # Plain tuples keep the snapshot compact and independent of the PostMetadata class
+        snapshot = [(post_id, tuple(metadata)) for post_id, metadata in self.posts_metadata.items()]
+        with tempfile.NamedTemporaryFile('wb', suffix='.pkl', delete=False) as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return f.name
     
     def convert_all(self) -> None:
         """Convert all HTML files in the posts directory"""
@@ -198,7 +748,11 @@ class SubstackConverter:
             return
         
         # Find all HTML files
-        html_files = list(self.posts_dir.glob("*.html"))
+        with os.scandir(self.posts_dir) as entries:
+            html_files = [
+                Path(entry.path) for entry in entries
+                if entry.name.endswith('.html') and entry.is_file(follow_symlinks=False)
+            ]
         
         if not html_files:
             print("No HTML files found in posts directory")
@@ -206,11 +760,37 @@ class SubstackConverter:
         
         print(f"Found {len(html_files)} HTML files to convert")
         
-        # Convert each file
-        successful = 0
+        # Leave out unpublished posts so they are never dispatched
+        tasks = []
         for html_file in html_files:
-            if self.convert_file(html_file):
-                successful += 1
+            metadata = self.posts_metadata.get(self._extract_post_id(html_file.name))
+            if self._is_unpublished(metadata):
+                print(f"Skipping unpublished post: {html_file.name}")
+            else:
+                tasks.append(html_file)
+        
+        # Convert each file, in parallel unless a single job was requested
+        successful = 0
+        if self.jobs > 1 and len(tasks) > 1:
+            metadata_path = self._write_metadata_snapshot()
+            try:
+                with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker,
+                                         initargs=(self, metadata_path)) as executor:
+                    results = executor.map(_convert_one, tasks, chunksize=8)
+                    progress = tqdm(zip(tasks, results), total=len(tasks), desc="Converting", unit="post")
+                    with logging_redirect_tqdm():
+                        for html_file, (ok, error) in progress:
+                            if ok:
+                                successful += 1
+                            elif error is not None:
+                                logging.warning("Error converting %s: %s", html_file.name, error)
+            finally:
+                os.unlink(metadata_path)
+        else:
+            with logging_redirect_tqdm():
+                for html_file in tqdm(tasks, desc="Converting", unit="post"):
+                    if self.convert_file(html_file):
+                        successful += 1
         
         print(f"\nConversion complete: {successful}/{len(html_files)} files converted successfully")
         print(f"Markdown files saved to: {os.path.abspath(self.output_dir)}")
@@ -228,11 +808,10 @@ def select_export_directory():
     
     # Get all directories in export folder with their modification times
     directories = []
-    for d in os.listdir(export_base):
-        dir_path = os.path.join(export_base, d)
-        if os.path.isdir(dir_path):
-            mod_time = os.path.getmtime(dir_path)
-            directories.append((d, mod_time))
+    with os.scandir(export_base) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                directories.append((entry.name, entry.stat().st_mtime))
     
     if not directories:
         print("No directories found in the export folder.")
@@ -266,8 +845,33 @@ def select_export_directory():
             return None
 
 
+def _positive_int(value: str) -> int:
+    """argparse type accepting integers of at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+
 def main():
     """Main function"""
+    parser = argparse.ArgumentParser(description="Convert a Substack export to Markdown")
+    parser.add_argument('--jobs', '-j', type=_positive_int, default=None,
+                        help="Number of worker processes (default: CPU count, 1 converts serially)")
+    parser.add_argument('--force', action='store_true',
+                        help="Convert every post, even if its output is up to date")
+    parser.add_argument('--converter', choices=CONVERTERS, default='native',
+                        help="HTML to Markdown converter (default: native, with html2text for unsupported tags)")
+    args = parser.parse_args()
+    
+    if args.converter == 'markdownify' and markdownify is None:
+        print("The markdownify converter requires an additional package. Please install:")
+        print("pip install markdownify")
+        return
+    
     # Select export directory interactively
     export_dir = select_export_directory()
     
@@ -279,7 +883,7 @@ def main():
     print(f"\nOutput directory: {output_dir}")
     
     # Create converter and run
-    converter = SubstackConverter(export_dir, output_dir)
+    converter = SubstackConverter(export_dir, output_dir, jobs=args.jobs, converter=args.converter, force=args.force)
     converter.convert_all()
 
 